@@ -3,14 +3,21 @@ Agent 类 - 智能体编排器
 负责协调多个 MCP 客户端和 LLM，处理工具调用循环
 """
 
-import json
-from typing import List, Optional, Dict, Any
+import asyncio
+from typing import List, Optional, Dict, Any, Callable, Tuple
+
+import orjson
 
 from MCPClient import MCPClient
 from ChatOpenAI import ChatOpenAI
+from http_client import close_shared_client
 from utils import log_title
 
 
+# 回填给 LLM 的单个工具结果的最大字节数
+MAX_TOOL_RESULT_BYTES = 16 * 1024
+
+
 class Agent:
     """
     智能体类，整合 MCP 工具和 LLM 进行自主任务执行
@@ -21,7 +28,9 @@ class Agent:
         model: str,
         mcp_clients: List[MCPClient],
         system_prompt: str = '',
-        context: str = ''
+        context: str = '',
+        terminal_tools: Optional[List[str]] = None,
+        max_history_tokens: Optional[int] = None
     ):
         """
         初始化 Agent
@@ -31,30 +40,80 @@ class Agent:
             mcp_clients: MCP 客户端列表
             system_prompt: 系统提示词
             context: 初始上下文
+            terminal_tools: 终结型工具名称列表，一轮调用的工具全部属于该列表时
+                直接返回结果，不再请求 LLM 继续对话
+            max_history_tokens: 对话历史的 token 上限，None 表示不限制
         """
         self.mcp_clients = mcp_clients
         self.model = model
         self.system_prompt = system_prompt
         self.context = context
+        self.terminal_tools = frozenset(terminal_tools or [])
+        self.max_history_tokens = max_history_tokens
         self.llm: Optional[ChatOpenAI] = None
+        self._tool_to_client: Dict[str, MCPClient] = {}
+        self._initialized = False
+        self._closed = False
+        self._init_lock = asyncio.Lock()
     
     async def init(self) -> None:
         """
-        初始化 Agent
+        初始化 Agent（重复或并发调用时只初始化一次）
         - 初始化所有 MCP 客户端
         - 收集所有工具
         - 创建 LLM 实例
         """
+        async with self._init_lock:
+            if not self._initialized:
+                await self._init()
+    
+    async def _init(self) -> None:
+        """执行实际的初始化，由 init() 在锁内调用"""
         log_title('TOOLS')
         
-        # 初始化所有 MCP 客户端
-        for client in self.mcp_clients:
-            await client.init()
+        # 并发初始化所有 MCP 客户端
+        results = await asyncio.gather(
+            *[client.init() for client in self.mcp_clients],
+            return_exceptions=True
+        )
+        errors = [
+            (client, result)
+            for client, result in zip(self.mcp_clients, results)
+            if isinstance(result, BaseException)
+        ]
+        if errors:
+            for client, error in errors:
+                print(f"❌ MCP 客户端 [{client.name}] 初始化失败: {error}")
+            # 关闭已成功启动的客户端，避免遗留服务器子进程
+            await asyncio.gather(
+                *[
+                    client.close()
+                    for client, result in zip(self.mcp_clients, results)
+                    if not isinstance(result, BaseException)
+                ],
+                return_exceptions=True
+            )
+            raise errors[0][1]
         
-        # 收集所有工具
+        # 收集所有工具，并建立工具名到客户端的索引
         tools = []
+        tools_definition = []
+        self._tool_to_client = {}
         for client in self.mcp_clients:
-            tools.extend(client.get_tools())
+            tools_definition.extend(client.get_openai_tools())
+            for tool in client.get_tools():
+                owner = self._tool_to_client.get(tool['name'])
+                if owner is not None:
+                    await asyncio.gather(
+                        *[c.close() for c in self.mcp_clients],
+                        return_exceptions=True
+                    )
+                    raise ValueError(
+                        f"工具名称冲突: {tool['name']} 同时由 "
+                        f"[{owner.name}] 和 [{client.name}] 提供"
+                    )
+                self._tool_to_client[tool['name']] = client
+                tools.append(tool)
         
         print(f"✅ 共加载 {len(tools)} 个工具")
         for i, tool in enumerate(tools, 1):
@@ -66,26 +125,49 @@ class Agent:
             model=self.model,
             system_prompt=self.system_prompt,
             tools=tools,
-            context=self.context
+            tools_definition=tools_definition,
+            context=self.context,
+            max_history_tokens=self.max_history_tokens
         )
+        self._initialized = True
+        self._closed = False
     
     async def close(self) -> None:
         """
-        关闭所有 MCP 客户端连接
+        关闭所有 MCP 客户端连接和共享 HTTP 连接池（重复调用时直接返回）
+        
+        连接池在下一次请求时会自动重建
         """
-        for client in self.mcp_clients:
-            await client.close()
+        if self._closed:
+            return
+        self._closed = True
+        self._initialized = False
+        self.llm = None
+        
+        await asyncio.gather(
+            *[client.close() for client in self.mcp_clients],
+            return_exceptions=True
+        )
+        await close_shared_client()
         print("✅ 所有 MCP 连接已关闭")
     
-    async def invoke(self, prompt: str) -> str:
+    async def invoke(
+        self,
+        prompt: str,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
         """
         执行一次完整的智能体调用
         - 发送用户输入
         - 处理工具调用循环
         - 返回最终结果
         
+        调用结束后 MCP 连接保持打开，可继续调用 invoke()；
+        使用完毕需调用 close() 或通过 async with 管理生命周期
+        
         Args:
             prompt: 用户输入
+            on_token: 每收到一段 LLM 文本时的回调，默认直接打印到终端
             
         Returns:
             最终的文本响应
@@ -97,34 +179,57 @@ class Agent:
             raise RuntimeError("Agent 未初始化，请先调用 init() 方法")
         
         # 首次对话
-        response = await self.llm.chat(prompt)
+        response = await self.llm.chat(prompt, on_token=on_token)
         
         # 工具调用循环
         while True:
             # 检查是否有工具调用
             if response['toolCalls'] and len(response['toolCalls']) > 0:
-                # 处理所有工具调用
-                for tool_call in response['toolCalls']:
-                    await self._handle_tool_call(tool_call)
+                # 并发处理所有工具调用，按原始顺序回填结果
+                tool_calls = response['toolCalls']
+                results = await asyncio.gather(
+                    *[self._handle_tool_call(tc) for tc in tool_calls],
+                    return_exceptions=True
+                )
+                # 取消、中断等非 Exception 异常不能当作工具结果回填
+                for result in results:
+                    if isinstance(result, BaseException) and not isinstance(result, Exception):
+                        raise result
+                outputs = [
+                    (f"工具调用失败: {result}",) * 2 + (False,)
+                    if isinstance(result, Exception) else result
+                    for result in results
+                ]
+                for tool_call, (_, llm_result, _) in zip(tool_calls, outputs):
+                    self.llm.append_tool_result(tool_call['id'], llm_result)
+                
+                # 工具结果已是最终答案时，省去一次 LLM 往返；
+                # 本轮 content 写于工具执行之前，只作为原始工具结果的前缀
+                succeeded = [ok for _, _, ok in outputs]
+                if not self._needs_followup(response, succeeded):
+                    tool_results = [raw_result for raw_result, _, _ in outputs]
+                    parts = [response['content']] if response['content'] else []
+                    return '\n\n'.join(parts + tool_results)
                 
                 # 工具调用后，让 LLM 处理结果并继续对话
-                response = await self.llm.chat()
+                response = await self.llm.chat(on_token=on_token)
                 continue
             
             # 没有工具调用，结束对话
-            await self.close()
             return response['content']
     
-    async def _handle_tool_call(self, tool_call: Dict[str, Any]) -> None:
+    async def _handle_tool_call(self, tool_call: Dict[str, Any]) -> Tuple[str, str, bool]:
         """
         处理单个工具调用
-        
+
         Args:
             tool_call: 工具调用对象
+
+        Returns:
+            (工具返回的原始文本, 需要回填给 LLM 的工具结果文本, 是否调用成功)
         """
         tool_name = tool_call['function']['name']
         tool_args_str = tool_call['function']['arguments']
-        tool_id = tool_call['id']
         
         log_title('TOOL USE')
         print(f"🔧 调用工具: {tool_name}")
@@ -133,36 +238,71 @@ class Agent:
         # 查找对应的 MCP 客户端
         mcp_client = self._find_mcp_client_for_tool(tool_name)
         
-        if mcp_client:
-            try:
-                # 解析参数
-                tool_args = json.loads(tool_args_str)
-                
-                # 调用工具
-                result_str = await mcp_client.call_tool(tool_name, tool_args)
-                # breakpoint()
-                # 格式化结果
-                result_str = json.dumps(result_str, ensure_ascii=False, indent=2)
-                print(f"✅ 结果: {result_str[:200]}...")  # 只打印前 200 字符
-                
-                # 将结果返回给 LLM
-                self.llm.append_tool_result(tool_id, result_str)
-                
-            except json.JSONDecodeError as e:
-                error_msg = f"参数解析失败: {e}"
-                print(f"❌ {error_msg}")
-                self.llm.append_tool_result(tool_id, error_msg)
-                
-            except Exception as e:
-                error_msg = f"工具调用失败: {e}"
-                print(f"❌ {error_msg}")
-                self.llm.append_tool_result(tool_id, error_msg)
-        else:
+        if not mcp_client:
             error_msg = f"未找到工具: {tool_name}"
-            print(f"❌ {error_msg}")
-            self.llm.append_tool_result(tool_id, error_msg)
+            print(f"❌ {error_msg}\n")
+            return error_msg, error_msg, False
+        
+        try:
+            # 解析参数
+            tool_args = orjson.loads(tool_args_str)
+            
+            # 调用工具
+            result_str = await mcp_client.call_tool(tool_name, tool_args)
+            # 格式化结果，超长时截断以控制上下文大小
+            result_bytes = orjson.dumps(result_str)
+            print(f"✅ 结果: {result_bytes[:200].decode(errors='ignore')}...\n")  # 只打印前 200 字节
+            return result_str, self._truncate_result(result_bytes), True
+            
+        except orjson.JSONDecodeError as e:
+            error_msg = f"参数解析失败: {e}"
+            
+        except Exception as e:
+            error_msg = f"工具调用失败: {e}"
+        
+        print(f"❌ {error_msg}\n")
+        return error_msg, error_msg, False
+    
+    @staticmethod
+    def _truncate_result(result_bytes: bytes) -> str:
+        """
+        将序列化后的工具结果截断到 MAX_TOOL_RESULT_BYTES 以内
+        
+        Args:
+            result_bytes: 序列化后的工具结果
+            
+        Returns:
+            截断后的结果文本
+        """
+        if len(result_bytes) <= MAX_TOOL_RESULT_BYTES:
+            return result_bytes.decode()
+        
+        omitted = len(result_bytes) - MAX_TOOL_RESULT_BYTES
+        head = result_bytes[:MAX_TOOL_RESULT_BYTES].decode(errors='ignore')
+        return f"{head}... [truncated {omitted} bytes]"
+    
+    def _needs_followup(
+        self,
+        response: Dict[str, Any],
+        succeeded: List[bool]
+    ) -> bool:
+        """
+        判断工具调用后是否需要再次请求 LLM
         
-        print()  # 空行分隔
+        Args:
+            response: 触发本轮工具调用的 LLM 响应
+            succeeded: 本轮每个工具调用是否成功
+            
+        Returns:
+            本轮调用的工具均为终结型工具且全部成功时返回 False，否则返回 True；
+            失败时交给 LLM 处理错误，而不是把错误信息当作最终答案
+        """
+        if not self.terminal_tools or not succeeded or not all(succeeded):
+            return True
+        return not all(
+            tool_call['function']['name'] in self.terminal_tools
+            for tool_call in response['toolCalls']
+        )
     
     def _find_mcp_client_for_tool(self, tool_name: str) -> Optional[MCPClient]:
         """
@@ -174,11 +314,7 @@ class Agent:
         Returns:
             对应的 MCP 客户端，如果未找到则返回 None
         """
-        for client in self.mcp_clients:
-            tools = client.get_tools()
-            if any(tool['name'] == tool_name for tool in tools):
-                return client
-        return None
+        return self._tool_to_client.get(tool_name)
 
     
     
@@ -223,19 +359,16 @@ async def example_usage():
         mcp_clients=[fetch_client, filesystem_client]
     )
 
-    # 初始化
-    await agent.init()
-    
-    # 执行任务
-    result = await agent.invoke(
-        r"""爬取https://example.com/网页中的内容，
-        并保存到C:\Users\32114\Desktop\code\llm-mcp-rag-py\output目录下的summary.txt中"""
-    )
+    # 初始化并执行任务，退出时自动关闭连接
+    async with agent:
+        result = await agent.invoke(
+            r"""爬取https://example.com/网页中的内容，
+            并保存到C:\Users\32114\Desktop\code\llm-mcp-rag-py\output目录下的summary.txt中"""
+        )
     
     print(f"\n最终结果: {result}")
     
 
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(example_usage())
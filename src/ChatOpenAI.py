@@ -1,17 +1,59 @@
 import os
-import json
-from typing import List, Dict, Any, Optional, TypedDict
-from openai import OpenAI
+import sys
+from typing import List, Dict, Any, Optional, Tuple, TypedDict, AsyncIterator, Callable
+import httpx
+from openai import AsyncOpenAI, DEFAULT_TIMEOUT
+import orjson
 from dotenv import load_dotenv
+from http_client import get_shared_client, close_shared_client
 from utils import log_title  # 假设你已经实现了 log_title
 
+# tiktoken 为可选依赖（未列入 requirement.txt）：未安装，或首次加载编码时
+# 下载 BPE 文件失败，都会退化为按 字符数 / 4 估算 token
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 # 加载环境变量
 load_dotenv()
 
 
+# 进程内复用的 AsyncOpenAI 客户端：(api_key, base_url) -> (所用连接池, 客户端)
+_async_clients: Dict[
+    Tuple[Optional[str], Optional[str]],
+    Tuple[httpx.AsyncClient, AsyncOpenAI]
+] = {}
+
+
+def _get_async_client(api_key: Optional[str], base_url: Optional[str]) -> AsyncOpenAI:
+    """
+    进程内按配置复用 AsyncOpenAI 客户端，底层使用共享的 HTTP 连接池
+    
+    共享连接池被 close_shared_client() 关闭并重建后，对应的客户端也随之重建
+    
+    共享连接池的超时按 Embedding 请求设置，这里显式使用 SDK 默认的
+    超时（连接 5s，读取 600s），避免首个 token 较慢的流式请求被提前中断
+    """
+    http_client = get_shared_client()
+    cached = _async_clients.get((api_key, base_url))
+    if cached is not None and cached[0] is http_client:
+        return cached[1]
+    
+    client = AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        timeout=DEFAULT_TIMEOUT
+    )
+    _async_clients[(api_key, base_url)] = (http_client, client)
+    return client
+
+
 class ToolCall(TypedDict):
     """工具调用的类型定义"""
     id: str
+    type: str  # 固定为 "function"
     function: Dict[str, str]  # {"name": str, "arguments": str}
 
 
@@ -30,7 +72,10 @@ class ChatOpenAI:
         model: str,
         system_prompt: str = '',
         tools: Optional[List[Tool]] = None,
-        context: str = ''
+        context: str = '',
+        max_history_tokens: Optional[int] = None,
+        verbose: bool = True,
+        tools_definition: Optional[List[Dict[str, Any]]] = None
     ):
         """
         初始化 ChatOpenAI 实例
@@ -40,14 +85,22 @@ class ChatOpenAI:
             system_prompt: 系统提示词
             tools: MCP 工具列表
             context: 初始上下文
+            max_history_tokens: 历史消息的 token 上限，超出时丢弃最早的对话轮次；
+                None 表示不限制。安装了 tiktoken 时首次计数会加载（必要时下载）
+                对应的编码文件
+            verbose: 是否将流式输出打印到终端
+            tools_definition: 预先转换好的 OpenAI 格式工具定义，提供时不再从 tools 转换
         """
-        self.llm = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_BASE_URL"),
-        )
+        self._api_key = os.getenv("OPENAI_API_KEY")
+        self._base_url = os.getenv("OPENAI_BASE_URL")
         self.model = model
+        self.verbose = verbose
         self.messages: List[Dict[str, Any]] = []
         self.tools = tools if tools is not None else []
+        if tools_definition is not None:
+            self._tools_payload = tools_definition or None
+        else:
+            self._tools_payload = self._get_tools_definition() if self.tools else None
         
         # 添加系统提示词
         if system_prompt:
@@ -56,45 +109,112 @@ class ChatOpenAI:
         # 添加初始上下文
         if context:
             self.messages.append({"role": "user", "content": context})
+        
+        # 系统提示词和初始上下文始终保留，不参与裁剪
+        self.max_history_tokens = max_history_tokens
+        self._pinned_count = len(self.messages)
+        self._encoding = None
+        # 与 messages 一一对应的 token 数及其总和，新消息只计数一次
+        self._token_counts: List[int] = []
+        self._total_tokens = 0
+    
+    @property
+    def llm(self) -> AsyncOpenAI:
+        """当前共享连接池上的 AsyncOpenAI 客户端（每次请求时获取）"""
+        return _get_async_client(self._api_key, self._base_url)
     
-    async def chat(self, prompt: Optional[str] = None) -> Dict[str, Any]:
+    async def chat(
+        self,
+        prompt: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """
         发送聊天消息并接收响应（支持流式输出）
         
         Args:
             prompt: 用户输入的消息
+            on_token: 每收到一段文本时的回调，默认在 verbose 模式下打印到终端
             
         Returns:
             包含 content 和 toolCalls 的字典
         """
+        result: Dict[str, Any] = {"content": "", "toolCalls": []}
+        # 终端输出缓冲，遇到换行或超过 512 字符才写出，避免逐 token flush
+        out_buf = ""
+        printed = False
+        
+        async for event in self.chat_stream(prompt):
+            if event["type"] == "token":
+                if on_token:
+                    on_token(event["text"])
+                elif self.verbose:
+                    printed = True
+                    out_buf += event["text"]
+                    if '\n' in event["text"] or len(out_buf) > 512:
+                        sys.stdout.write(out_buf)
+                        sys.stdout.flush()
+                        out_buf = ""
+            elif event["type"] == "done":
+                result = {
+                    "content": event["content"],
+                    "toolCalls": event["toolCalls"],
+                }
+        
+        if printed:
+            sys.stdout.write(out_buf + "\n")  # 写出剩余内容并换行
+            sys.stdout.flush()
+        
+        return result
+    
+    async def chat_stream(
+        self,
+        prompt: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        发送聊天消息并以事件流的形式逐步返回响应
+        
+        事件类型：
+            - {"type": "token", "text": str}：文本片段
+            - {"type": "tool_call_delta", "index": int, "id": str, "name": str, "arguments": str}：工具调用片段
+            - {"type": "done", "content": str, "toolCalls": List[ToolCall]}：响应结束
+        
+        Args:
+            prompt: 用户输入的消息
+            
+        Yields:
+            流式事件字典
+        """
         log_title('CHAT')
         
         # 添加用户消息
         if prompt:
             self.messages.append({"role": "user", "content": prompt})
         
+        # 裁剪超出预算的历史消息
+        self._prune()
+        
         # 创建流式聊天完成
-        stream = self.llm.chat.completions.create(
+        stream = await self.llm.chat.completions.create(
             model=self.model,
             messages=self.messages,
             stream=True,
-            tools=self._get_tools_definition() if self.tools else None,
+            tools=self._tools_payload,
         )
         
-        content = ""
-        tool_calls: List[ToolCall] = []
+        # 以列表收集片段，结束后一次性拼接，避免字符串反复复制
+        content_parts: List[str] = []
+        tool_call_parts: List[Dict[str, List[str]]] = []
         
         log_title('RESPONSE')
         
         # 处理流式响应
-        for chunk in stream:
+        async for chunk in stream:
             delta = chunk.choices[0].delta
             
             # 处理普通文本内容
             if delta.content:
-                content_chunk = delta.content
-                content += content_chunk
-                print(content_chunk, end='', flush=True)
+                content_parts.append(delta.content)
+                yield {"type": "token", "text": delta.content}
             
             # 处理工具调用
             if delta.tool_calls:
@@ -102,23 +222,42 @@ class ChatOpenAI:
                     index = tool_call_chunk.index
                     
                     # 第一次出现该索引时创建新的 tool_call
-                    if len(tool_calls) <= index:
-                        tool_calls.append({
-                            "id": "",
-                            "function": {"name": "", "arguments": ""}
-                        })
+                    while len(tool_call_parts) <= index:
+                        tool_call_parts.append({"id": [], "name": [], "arguments": []})
                     
-                    current_call = tool_calls[index]
+                    current_parts = tool_call_parts[index]
+                    call_id = tool_call_chunk.id or ""
+                    name = ""
+                    arguments = ""
+                    if tool_call_chunk.function:
+                        name = tool_call_chunk.function.name or ""
+                        arguments = tool_call_chunk.function.arguments or ""
                     
                     # 累积工具调用的各个部分
-                    if tool_call_chunk.id:
-                        current_call["id"] += tool_call_chunk.id
-                    if tool_call_chunk.function and tool_call_chunk.function.name:
-                        current_call["function"]["name"] += tool_call_chunk.function.name
-                    if tool_call_chunk.function and tool_call_chunk.function.arguments:
-                        current_call["function"]["arguments"] += tool_call_chunk.function.arguments
+                    current_parts["id"].append(call_id)
+                    current_parts["name"].append(name)
+                    current_parts["arguments"].append(arguments)
+                    
+                    yield {
+                        "type": "tool_call_delta",
+                        "index": index,
+                        "id": call_id,
+                        "name": name,
+                        "arguments": arguments,
+                    }
         
-        print()  # 换行
+        content = "".join(content_parts)
+        tool_calls: List[ToolCall] = [
+            {
+                "id": "".join(parts["id"]),
+                "type": "function",
+                "function": {
+                    "name": "".join(parts["name"]),
+                    "arguments": "".join(parts["arguments"]),
+                }
+            }
+            for parts in tool_call_parts
+        ]
         
         # 将助手响应添加到消息历史
         assistant_message: Dict[str, Any] = {
@@ -128,18 +267,12 @@ class ChatOpenAI:
         
         # 如果有工具调用，添加到消息中
         if tool_calls:
-            assistant_message["tool_calls"] = [
-                {
-                    "id": call["id"],
-                    "type": "function",
-                    "function": call["function"]
-                }
-                for call in tool_calls
-            ]
+            assistant_message["tool_calls"] = tool_calls
         
         self.messages.append(assistant_message)
         
-        return {
+        yield {
+            "type": "done",
             "content": content,
             "toolCalls": tool_calls,
         }
@@ -158,6 +291,102 @@ class ChatOpenAI:
             "tool_call_id": tool_call_id
         })
     
+    def _prune(self) -> None:
+        """
+        按 token 预算原地裁剪历史消息（滑动窗口）
+        - 始终保留系统提示词和初始上下文
+        - 带 tool_calls 的助手消息与其 tool 回复作为整体保留或丢弃
+        - 至少保留最近的一轮消息
+        
+        每条消息的 token 数在首次出现时计算并缓存，未超出预算时只需比较总数
+        """
+        if self.max_history_tokens is None:
+            return
+        
+        self._sync_token_counts()
+        if self._total_tokens <= self.max_history_tokens:
+            return
+        
+        messages = self.messages
+        counts = self._token_counts
+        total = self._total_tokens
+        start = cut = self._pinned_count
+        
+        # 从最早的一组开始丢弃，tool 回复归入其前面的助手消息
+        while total > self.max_history_tokens:
+            end = cut + 1
+            while end < len(messages) and messages[end]["role"] == "tool":
+                end += 1
+            if end >= len(messages):
+                break
+            total -= sum(counts[cut:end])
+            cut = end
+        
+        if cut > start:
+            del messages[start:cut]
+            del counts[start:cut]
+            self._total_tokens = total
+    
+    def _sync_token_counts(self) -> None:
+        """为尚未计数的新消息计算 token 数并累加到总数"""
+        if len(self._token_counts) > len(self.messages):
+            # 消息历史被外部替换或截断，重新计数
+            self._token_counts = []
+            self._total_tokens = 0
+        
+        for message in self.messages[len(self._token_counts):]:
+            count = self._count_tokens(message)
+            self._token_counts.append(count)
+            self._total_tokens += count
+    
+    def _count_tokens(self, message: Dict[str, Any]) -> int:
+        """
+        估算单条消息的 token 数
+        
+        Args:
+            message: 消息字典
+            
+        Returns:
+            token 数
+        """
+        text = message.get("content") or ""
+        if message.get("tool_calls"):
+            text += orjson.dumps(message["tool_calls"]).decode()
+        
+        encoding = self._get_encoding()
+        if encoding is None:
+            return len(text) // 4 + 4
+        return len(encoding.encode(text)) + 4
+    
+    def _get_encoding(self):
+        """
+        加载并缓存 tiktoken 编码，不可用时返回 None
+        
+        Returns:
+            tiktoken 编码对象，或 None
+        """
+        if self._encoding is None:
+            self._encoding = False
+            if tiktoken is not None:
+                try:
+                    try:
+                        self._encoding = tiktoken.encoding_for_model(self.model)
+                    except KeyError:
+                        self._encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    print(f"⚠️ 加载 tiktoken 编码失败，按字符数估算 token: {e}")
+        return self._encoding or None
+    
+    def set_tools(self, tools: List[Tool]) -> None:
+        """
+        替换工具列表并重新生成 OpenAI 工具定义缓存
+        
+        Args:
+            tools: MCP 工具列表
+        """
+        self.tools = tools
+        self._tools_payload = self._get_tools_definition() if self.tools else None
+    
     def _get_tools_definition(self) -> List[Dict[str, Any]]:
         """
         将 MCP 工具格式转换为 OpenAI API 格式
@@ -204,27 +433,31 @@ async def main():
         context="我们正在讨论 RAG 系统"
     )
     
-    # 发送消息
-    response = await chat.chat("请帮我搜索关于向量数据库的文档")
-    
-    # 处理工具调用
-    if response["toolCalls"]:
-        for tool_call in response["toolCalls"]:
-            tool_name = tool_call["function"]["name"]
-            tool_args = json.loads(tool_call["function"]["arguments"])
-            
-            print(f"\n调用工具: {tool_name}")
-            print(f"参数: {tool_args}")
-            
-            # 模拟工具执行
-            tool_result = "找到 3 篇关于向量数据库的文档..."
-            
-            # 将结果追加到对话
-            chat.append_tool_result(tool_call["id"], tool_result)
+    try:
+        # 发送消息
+        response = await chat.chat("请帮我搜索关于向量数据库的文档")
         
-        # 继续对话，让 LLM 处理工具结果
-        final_response = await chat.chat()
-        print(f"\n最终响应: {final_response['content']}")
+        # 处理工具调用
+        if response["toolCalls"]:
+            for tool_call in response["toolCalls"]:
+                tool_name = tool_call["function"]["name"]
+                tool_args = orjson.loads(tool_call["function"]["arguments"])
+                
+                print(f"\n调用工具: {tool_name}")
+                print(f"参数: {tool_args}")
+                
+                # 模拟工具执行
+                tool_result = "找到 3 篇关于向量数据库的文档..."
+                
+                # 将结果追加到对话
+                chat.append_tool_result(tool_call["id"], tool_result)
+            
+            # 继续对话，让 LLM 处理工具结果
+            final_response = await chat.chat()
+            print(f"\n最终响应: {final_response['content']}")
+    finally:
+        # 程序退出前关闭共享连接池
+        await close_shared_client()
 
 
 if __name__ == "__main__":
@@ -4,16 +4,24 @@ EmbeddingRetriever 类 - 嵌入向量生成和检索
 """
 
 import os
-import requests
+import random
+import asyncio
+import httpx
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
+from http_client import get_shared_client
 from utils import log_title
 from VectorStore import VectorStore
 
 # 加载环境变量
 load_dotenv()
 
+# Embedding 请求的重试策略
+MAX_RETRY_ATTEMPTS = 4
+RETRY_INITIAL_DELAY = 0.2
+RETRY_MAX_DELAY = 4.0
+
 
 class EmbeddingRetriever:
     """
@@ -21,15 +29,22 @@ class EmbeddingRetriever:
     负责生成嵌入向量并从向量存储中检索相关文档
     """
     
-    def __init__(self, embedding_model: str):
+    def __init__(
+        self,
+        embedding_model: str,
+        quantization: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
         """
         初始化嵌入检索器
         
         Args:
             embedding_model: 嵌入模型名称（如 "BAAI/bge-large-zh-v1.5"）
+            quantization: 向量存储的量化方式（None / "fp16" / "int8"）
+            http_client: 自定义 HTTP 客户端，默认使用进程内共享的客户端
         """
         self.embedding_model = embedding_model
-        self.vector_store = VectorStore()
+        self.vector_store = VectorStore(quantization=quantization)
         
         # 从环境变量获取配置
         self.embedding_base_url = os.getenv("EMBEDDING_BASE_URL")
@@ -39,6 +54,19 @@ class EmbeddingRetriever:
             raise ValueError(
                 "请在 .env 文件中设置 EMBEDDING_BASE_URL 和 EMBEDDING_KEY"
             )
+        
+        # 预先构建请求地址、请求头和公共请求体
+        self._url = f"{self.embedding_base_url}/embeddings"
+        self._headers = {
+            "Authorization": f"Bearer {self.embedding_key}",
+            "Content-Type": "application/json"
+        }
+        self._base_payload = {
+            "model": self.embedding_model,
+            "encoding_format": "float"
+        }
+        
+        self._http_client = http_client
     
     async def embed_document(self, document: str) -> List[float]:
         """
@@ -73,6 +101,33 @@ class EmbeddingRetriever:
         
         return embedding
     
+    async def embed_documents(
+        self,
+        documents: List[str],
+        max_batch: int = 64
+    ) -> List[List[float]]:
+        """
+        批量生成文档的嵌入向量并添加到向量存储
+        每批文档只发送一次 API 请求
+        
+        Args:
+            documents: 文档内容列表
+            max_batch: 单次请求的最大文档数量
+            
+        Returns:
+            与 documents 顺序一致的嵌入向量列表
+        """
+        log_title('EMBEDDING DOCUMENTS')
+        
+        embeddings: List[List[float]] = []
+        for start in range(0, len(documents), max_batch):
+            batch = documents[start:start + max_batch]
+            batch_embeddings = await self._embed_batch(batch)
+            await self.vector_store.add_embeddings(batch_embeddings, batch)
+            embeddings.extend(batch_embeddings)
+        
+        return embeddings
+    
     async def _embed(self, text: str) -> List[float]:
         """
         调用 Embedding API 生成嵌入向量（私有方法）
@@ -84,40 +139,58 @@ class EmbeddingRetriever:
             嵌入向量
             
         Raises:
-            requests.RequestException: API 调用失败
+            httpx.HTTPError: API 调用失败
             KeyError: 响应格式错误
         """
-        url = f"{self.embedding_base_url}/embeddings"
+        embeddings = await self._embed_batch([text])
+        return embeddings[0]
+    
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        调用 Embedding API 批量生成嵌入向量（私有方法）
         
-        payload = {
-            "model": self.embedding_model,
-            "input": text,
-            "encoding_format": "float"
-        }
+        Args:
+            texts: 输入文本列表
+            
+        Returns:
+            与 texts 顺序一致的嵌入向量列表
+            
+        Raises:
+            httpx.HTTPError: API 调用失败
+            KeyError: 响应格式错误
+            ValueError: 返回的嵌入向量数量与输入不一致
+        """
+        if not texts:
+            return []
         
-        headers = {
-            "Authorization": f"Bearer {self.embedding_key}",
-            "Content-Type": "application/json"
-        }
+        payload = {**self._base_payload, "input": texts}
         
+        data = None
         try:
-            # 发送请求
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()  # 检查 HTTP 错误
+            # 发送请求（瞬时错误自动重试）
+            response = await self._post_with_retry(self._url, payload)
             
             # 解析响应
             data = response.json()
             
-            # 提取嵌入向量
-            embedding = data["data"][0]["embedding"]
+            # 按 index 还原输入顺序并提取嵌入向量
+            embeddings = [
+                item["embedding"]
+                for item in sorted(data["data"], key=lambda x: x["index"])
+            ]
+            if len(embeddings) != len(texts):
+                raise ValueError(
+                    f"嵌入向量数量 ({len(embeddings)}) 与输入文本数量 ({len(texts)}) 不一致"
+                )
             
             # 打印嵌入向量的前几个值（用于调试）
-            print(f"嵌入向量维度: {len(embedding)}")
-            print(f"前 5 个值: {embedding[:5]}")
+            print(f"嵌入向量数量: {len(embeddings)}")
+            print(f"嵌入向量维度: {len(embeddings[0])}")
+            print(f"前 5 个值: {embeddings[0][:5]}")
             
-            return embedding
+            return embeddings
             
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"❌ API 请求失败: {e}")
             raise
             
@@ -126,6 +199,41 @@ class EmbeddingRetriever:
             print(f"响应内容: {data}")
             raise
     
+    async def _post_with_retry(self, url: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        发送 POST 请求，对 429/5xx 和网络错误做指数退避重试（私有方法）
+        其他 4xx 错误立即抛出
+        
+        Args:
+            url: 请求地址
+            payload: 请求体
+            
+        Returns:
+            成功的响应
+            
+        Raises:
+            httpx.HTTPError: 重试耗尽或不可重试的错误
+        """
+        for attempt in range(1, MAX_RETRY_ATTEMPTS + 1):
+            try:
+                http = self._http_client or get_shared_client()
+                response = await http.post(url, json=payload, headers=self._headers)
+                response.raise_for_status()  # 检查 HTTP 错误
+                return response
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if status != 429 and status < 500 or attempt == MAX_RETRY_ATTEMPTS:
+                    raise
+            except httpx.TransportError:
+                if attempt == MAX_RETRY_ATTEMPTS:
+                    raise
+            
+            # 全抖动：在 [0, 退避上限] 内随机等待，不超过 RETRY_MAX_DELAY
+            delay = min(RETRY_MAX_DELAY, RETRY_INITIAL_DELAY * 2 ** (attempt - 1))
+            delay = random.uniform(0, delay)
+            print(f"⚠️ Embedding 请求失败，{delay:.2f}s 后重试（第 {attempt} 次）")
+            await asyncio.sleep(delay)
+    
     async def retrieve(self, query: str, top_k: int = 3) -> List[str]:
         """
         检索与查询最相关的文档
@@ -137,16 +245,39 @@ class EmbeddingRetriever:
         Returns:
             最相关的文档列表
         """
-        # 生成查询的嵌入向量
-        query_embedding = await self.embed_query(query)
+        results = await self.retrieve_many([query], top_k)
+        return results[0]
+    
+    async def retrieve_many(
+        self,
+        queries: List[str],
+        top_k: int = 3
+    ) -> List[List[str]]:
+        """
+        批量检索多个查询的相关文档
+        所有查询的嵌入向量通过一次 API 请求生成
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回的文档数量
+            
+        Returns:
+            与 queries 顺序一致的文档列表
+        """
+        # 生成所有查询的嵌入向量
+        log_title('EMBEDDING QUERY')
+        query_embeddings = await self._embed_batch(queries)
         
         # 在向量存储中搜索
         log_title('RETRIEVING DOCUMENTS')
-        results = await self.vector_store.search(query_embedding, top_k)
+        results = await asyncio.gather(*[
+            self.vector_store.search(embedding, top_k)
+            for embedding in query_embeddings
+        ])
         
-        print(f"✅ 检索到 {len(results)} 个相关文档\n")
+        print(f"✅ 检索到 {sum(len(r) for r in results)} 个相关文档\n")
         
-        return results
+        return list(results)
     
     def get_vector_store_size(self) -> int:
         """
@@ -166,6 +297,7 @@ class EmbeddingRetriever:
 
 async def example_usage():
     """EmbeddingRetriever 使用示例"""
+    from http_client import close_shared_client
     
     # 创建检索器
     retriever = EmbeddingRetriever(
@@ -182,8 +314,7 @@ async def example_usage():
     ]
     
     print("📚 添加文档到向量存储...")
-    for doc in documents:
-        await retriever.embed_document(doc)
+    await retriever.embed_documents(documents)
     
     print(f"\n✅ 向量存储大小: {retriever.get_vector_store_size()}\n")
     
@@ -196,8 +327,9 @@ async def example_usage():
     print("📄 检索结果:")
     for i, doc in enumerate(results, 1):
         print(f"  {i}. {doc}\n")
+    
+    await close_shared_client()
 
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(example_usage())
@@ -4,14 +4,23 @@ MCP (Model Context Protocol) 客户端封装
 """
 
 import asyncio
-from typing import Optional, List, Dict, Any
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
 from contextlib import AsyncExitStack
 
+import orjson
+
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from mcp.types import Tool
 
 
+# 进程内 ListTools 缓存：(command, args, env) -> (写入时间, 工具列表)
+_ToolsCacheKey = Tuple[str, Tuple[str, ...], Tuple[Tuple[str, str], ...]]
+_TOOLS_CACHE: Dict[_ToolsCacheKey, Tuple[float, List[Tool]]] = {}
+
+
 class MCPClient:
     """MCP 客户端类，用于连接和管理 MCP 服务器"""
     
@@ -20,7 +29,13 @@ class MCPClient:
         name: str,
         command: str,
         args: List[str],
-        version: str = "0.0.1"
+        version: str = "0.0.1",
+        cache: bool = False,
+        cache_ttl_seconds: float = 300,
+        cacheable_tools: Optional[List[str]] = None,
+        result_cache_ttl_seconds: float = 60,
+        result_cache_size: int = 128,
+        env: Optional[Dict[str, str]] = None
     ):
         """
         初始化 MCP 客户端
@@ -30,32 +45,88 @@ class MCPClient:
             command: 服务器启动命令（如 "python", "node"）
             args: 服务器启动参数（如脚本路径）
             version: 客户端版本号
+            cache: 是否复用进程内缓存的工具列表，跳过 list_tools 请求
+            cache_ttl_seconds: 工具列表缓存的有效期（秒）
+            cacheable_tools: 可缓存调用结果的只读工具名称列表（默认不缓存）
+            result_cache_ttl_seconds: 工具结果缓存的有效期（秒）
+            result_cache_size: 工具结果缓存的最大条目数（LRU 淘汰）
+            env: 额外传给服务器进程的环境变量；None 时只继承 MCP SDK
+                默认白名单中的变量（PATH、HOME 等），而非完整的 os.environ
         """
         self.name = name
         self.command = command
         self.args = args
         self.version = version
+        self.cache = cache
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cacheable_tools = set(cacheable_tools or [])
+        self.result_cache_ttl_seconds = result_cache_ttl_seconds
+        self.result_cache_size = result_cache_size
+        self.env = env
         
         # 核心组件
         self.session: Optional[ClientSession] = None
         self.exit_stack = AsyncExitStack()
         self.tools: List[Tool] = []
+        self._tools_cache: List[Dict[str, Any]] = []
+        self._openai_tools_cache: List[Dict[str, Any]] = []
+        self._tool_names: frozenset = frozenset()
+        # 工具结果 LRU 缓存：(工具名, 规范化参数) -> (写入时间, 结果)
+        self._result_cache: "OrderedDict[Tuple[str, bytes], Tuple[float, str]]" = OrderedDict()
+        
+        # 后台加载工具列表的任务及其失败原因
+        self._tools_task: Optional[asyncio.Task] = None
+        self._tools_error: Optional[Exception] = None
+        
+        # 持有连接上下文的任务及其关闭信号
+        self._session_task: Optional[asyncio.Task] = None
+        self._close_event: Optional[asyncio.Event] = None
         
         # 传输层组件
         self.stdio = None
         self.write = None
     
-    async def init(self) -> None:
-        """初始化客户端并连接到服务器"""
+    async def init(self, wait_for_tools: bool = True) -> None:
+        """
+        初始化客户端并连接到服务器
+        
+        Args:
+            wait_for_tools: 是否等待工具列表加载完成；为 False 时 list_tools
+                在后台进行，加载完成前调用 get_tools() 等方法会抛出 RuntimeError，
+                需先 await wait_for_tools()
+        """
         await self._connect_to_server()
+        if wait_for_tools:
+            await self.wait_for_tools()
+    
+    async def wait_for_tools(self) -> None:
+        """
+        等待后台的工具列表加载完成
+        
+        Raises:
+            RuntimeError: 如果工具列表获取失败
+        """
+        if self._tools_task is None:
+            return
+        await self._tools_task
+        self._check_tools_ready()
     
     async def close(self) -> None:
         """安全关闭客户端连接"""
         if not hasattr(self, "exit_stack"):
             return
+        
+        if self._tools_task is not None and not self._tools_task.done():
+            self._tools_task.cancel()
+            await asyncio.gather(self._tools_task, return_exceptions=True)
+        
+        # 通知连接任务退出上下文，并等待其完成清理
+        if self._close_event is not None:
+            self._close_event.set()
 
         try:
-            await self.exit_stack.aclose()
+            if self._session_task is not None:
+                await self._session_task
         except GeneratorExit:
             # 异步生成器被强制关闭时
             pass
@@ -71,6 +142,14 @@ class MCPClient:
         except Exception as e:
             print(f"⚠️ MCPClient.close() 异常: {e}")
         finally:
+            # 释放会话和工具相关缓存
+            self.session = None
+            self._tools_task = None
+            self._tools_error = None
+            self._session_task = None
+            self._close_event = None
+            self._set_tools([])
+            self._result_cache.clear()
             print(f"✅ MCPClient [{self.name}] closed safely")
     
     def get_tools(self) -> List[Dict[str, Any]]:
@@ -79,15 +158,85 @@ class MCPClient:
         
         Returns:
             工具定义列表，格式与 OpenAI Function Calling 兼容
+            
+        Raises:
+            RuntimeError: 如果工具列表仍在加载或加载失败
+        """
+        self._check_tools_ready()
+        return self._tools_cache
+    
+    def has_tool(self, name: str) -> bool:
         """
-        return [
+        判断服务器是否提供指定名称的工具
+        
+        Args:
+            name: 工具名称
+            
+        Returns:
+            是否存在该工具
+            
+        Raises:
+            RuntimeError: 如果工具列表仍在加载或加载失败
+        """
+        self._check_tools_ready()
+        return name in self._tool_names
+    
+    def get_openai_tools(self) -> List[Dict[str, Any]]:
+        """
+        获取 OpenAI Function Calling 格式的工具定义（已缓存）
+        
+        Returns:
+            可直接传给 chat.completions.create(tools=...) 的工具定义列表
+            
+        Raises:
+            RuntimeError: 如果工具列表仍在加载或加载失败
+        """
+        self._check_tools_ready()
+        return self._openai_tools_cache
+    
+    def _check_tools_ready(self) -> None:
+        """
+        确认后台的工具列表已加载成功
+        
+        Raises:
+            RuntimeError: 如果工具列表仍在加载或加载失败
+        """
+        if self._tools_task is not None and not self._tools_task.done():
+            raise RuntimeError("工具列表仍在加载中，请先 await wait_for_tools()")
+        if self._tools_error is not None:
+            raise RuntimeError(
+                f"无法获取 MCP 工具列表: {self._tools_error}"
+            ) from self._tools_error
+    
+    def _set_tools(self, tools: List[Tool]) -> None:
+        """
+        设置工具列表并预先构建转换结果与名称索引
+        
+        Args:
+            tools: 服务器返回的工具列表
+        """
+        self.tools = tools
+        self._tools_cache = [
             {
                 "name": tool.name,
                 "description": tool.description,
                 "inputSchema": tool.inputSchema,
             }
-            for tool in self.tools
+            for tool in tools
         ]
+        self._openai_tools_cache = [
+            {
+                "type": "function",
+                "function": {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "parameters": tool.inputSchema,
+                }
+            }
+            for tool in tools
+        ]
+        self._tool_names = frozenset(tool.name for tool in tools)
+    
     def _extract_text_from_result(self, result) -> str:
         """
         从 CallToolResult 提取文本
@@ -99,24 +248,22 @@ class MCPClient:
             提取的文本字符串
         """
         try:
-            if hasattr(result, 'isError') and result.isError:
-                # 如果是错误结果
-                error_text = []
-                for item in result.content:
-                    if hasattr(item, 'text'):
-                        error_text.append(item.text)
-                return f"错误: {' '.join(error_text)}"
+            text_parts = [
+                text
+                for text in (getattr(item, 'text', None) for item in result.content)
+                if text is not None
+            ]
             
-            # 正常结果，提取所有文本
-            text_parts = []
-            for item in result.content:
-                if hasattr(item, 'text'):
-                    text_parts.append(item.text)
+            if getattr(result, 'isError', False):
+                # 如果是错误结果
+                return f"错误: {' '.join(text_parts)}"
             
+            # 正常结果，返回所有文本
             return '\n\n'.join(text_parts) if text_parts else str(result)
         
         except Exception as e:
             return f"提取结果失败: {str(e)}"
+    
     async def call_tool(
         self,
         name: str,
@@ -125,6 +272,8 @@ class MCPClient:
         """
         调用 MCP 工具
         
+        同一会话上的多次调用按请求 ID 区分，可以通过 asyncio.gather 并发执行
+        
         Args:
             name: 工具名称
             params: 工具参数（字典格式）
@@ -138,57 +287,171 @@ class MCPClient:
         if not self.session:
             raise RuntimeError("客户端未初始化，请先调用 init() 方法")
         
+        cacheable = name in self.cacheable_tools
+        if cacheable:
+            key = (name, orjson.dumps(params or {}, option=orjson.OPT_SORT_KEYS))
+            cached = self._result_cache.get(key)
+            if cached and time.monotonic() - cached[0] < self.result_cache_ttl_seconds:
+                self._result_cache.move_to_end(key)
+                return cached[1]
+        
         result = await self.session.call_tool(
             name=name,
             arguments=params or {}
         )
+        text = self._extract_text_from_result(result)
+        
+        # 只缓存成功的结果
+        if cacheable and not getattr(result, 'isError', False):
+            self._result_cache[key] = (time.monotonic(), text)
+            self._result_cache.move_to_end(key)
+            while len(self._result_cache) > self.result_cache_size:
+                self._result_cache.popitem(last=False)
         
-        return self._extract_text_from_result(result)
+        return text
     
     async def _connect_to_server(self) -> None:
         """
         连接到 MCP 服务器（私有方法）
         
+        连接上下文由独立的 _run_session 任务持有，init() 与 close() 可以在
+        不同的任务中调用（例如 asyncio.gather 并发初始化多个客户端）
+        
         Raises:
             ValueError: 如果命令或参数无效
             RuntimeError: 如果连接失败
         """
+        ready = asyncio.get_running_loop().create_future()
+        self._close_event = asyncio.Event()
+        self._session_task = asyncio.create_task(self._run_session(ready))
+        
         try:
-            # 配置服务器参数
-            server_params = StdioServerParameters(
-                command=self.command,
-                args=self.args,
-                env=None  # 可以传入环境变量字典
-            )
-            
-            # 建立传输层连接
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            self.stdio, self.write = stdio_transport
+            await ready
             
-            # 创建会话
-            self.session = await self.exit_stack.enter_async_context(
-                ClientSession(self.stdio, self.write)
-            )
-            
-            # 初始化会话
-            await self.session.initialize()
-            
-            # 获取可用工具列表
-            tools_response = await self.session.list_tools()
-            self.tools = tools_response.tools
-            
-            tool_names = [tool.name for tool in self.tools]
-            print(f"✅ 已连接到 MCP 服务器，可用工具: {tool_names}")
+            # 握手完成后立即在后台获取工具列表，init() 的调用方可按需等待
+            self._tools_error = None
+            self._tools_task = asyncio.create_task(self._load_tools())
         except asyncio.CancelledError:
             # 若上层被取消任务，不传播异常
             print("⚠️ MCPClient 连接任务被取消，已安全退出。")
+            self._session_task.cancel()
+            await asyncio.gather(self._session_task, return_exceptions=True)
+            self._session_task = None
             raise        
         except Exception as e:
+            # 连接任务已在自身内部完成清理
+            self._session_task = None
             print(f"❌ 连接到 MCP 服务器失败: {e}")
             raise RuntimeError(f"无法连接到 MCP 服务器: {e}") from e
     
+    async def _run_session(self, ready: asyncio.Future) -> None:
+        """
+        持有 stdio_client 与 ClientSession 上下文的任务
+        
+        AnyIO 要求 cancel scope 在进入它的任务中退出，因此上下文的进入与
+        退出都在本任务内完成：握手成功后通过 ready 通知调用方，然后等待
+        close() 发出关闭信号
+        
+        Args:
+            ready: 握手完成（或失败）时设置结果的 Future
+        """
+        try:
+            async with self.exit_stack:
+                # 配置服务器参数
+                server_params = StdioServerParameters(
+                    command=self.command,
+                    args=self.args,
+                    env=self.env
+                )
+                
+                # 建立传输层连接
+                stdio_transport = await self.exit_stack.enter_async_context(
+                    stdio_client(server_params)
+                )
+                self.stdio, self.write = stdio_transport
+                
+                # 创建会话
+                self.session = await self.exit_stack.enter_async_context(
+                    ClientSession(self.stdio, self.write)
+                )
+                
+                # 初始化会话
+                await self.session.initialize()
+                
+                ready.set_result(None)
+                await self._close_event.wait()
+        except Exception as e:
+            # 握手前的失败交给 _connect_to_server 处理，之后的由 close() 处理
+            if ready.done():
+                raise
+            ready.set_exception(e)
+        except BaseException:
+            if not ready.done():
+                ready.cancel()
+            raise
+    
+    async def _load_tools(self) -> None:
+        """
+        获取工具列表并更新缓存（后台任务）
+        
+        失败原因记录在 _tools_error 中，由 wait_for_tools() 或 get_tools()
+        抛出，任务本身不会以异常结束
+        """
+        try:
+            # 命中缓存时跳过 list_tools 请求
+            self._set_tools(await self._list_tools())
+        except Exception as e:
+            self._tools_error = e
+            print(f"❌ 获取 MCP 工具列表失败: {e}")
+            return
+        
+        tool_names = [tool.name for tool in self.tools]
+        print(f"✅ 已连接到 MCP 服务器 [{self.name}]，可用工具: {tool_names}")
+    
+    async def _list_tools(self) -> List[Tool]:
+        """
+        获取服务器工具列表，启用缓存时优先读取未过期的缓存
+        
+        Returns:
+            工具列表
+        """
+        key = self._cache_key()
+        if self.cache:
+            cached = _TOOLS_CACHE.get(key)
+            if cached and time.monotonic() - cached[0] < self.cache_ttl_seconds:
+                self._seed_output_schemas(cached[1])
+                return cached[1]
+        
+        tools_response = await self.session.list_tools()
+        tools = tools_response.tools
+        _TOOLS_CACHE[key] = (time.monotonic(), tools)
+        return tools
+    
+    def _seed_output_schemas(self, tools: List[Tool]) -> None:
+        """
+        用缓存的工具列表填充会话的输出 schema 缓存
+
+        较新的 MCP SDK 在 call_tool 校验结果时，若会话中没有该工具的 schema
+        会自行调用 list_tools；预先填充可避免把这次往返推迟到首次工具调用
+
+        Args:
+            tools: 缓存的工具列表
+        """
+        schemas = getattr(self.session, '_tool_output_schemas', None)
+        if isinstance(schemas, dict):
+            for tool in tools:
+                schemas[tool.name] = getattr(tool, 'outputSchema', None)
+
+    def _cache_key(self) -> _ToolsCacheKey:
+        """工具列表缓存的键，环境变量不同的同一服务器分别缓存"""
+        env = tuple(sorted(self.env.items())) if self.env else ()
+        return (self.command, tuple(self.args), env)
+    
+    @classmethod
+    def invalidate_tools_cache(cls) -> None:
+        """清空进程内的工具列表缓存，下次连接时强制重新获取"""
+        _TOOLS_CACHE.clear()
+    
     async def __aenter__(self):
         """支持异步上下文管理器"""
         await self.init()
@@ -3,25 +3,59 @@ VectorStore 类 - 简单的向量存储和检索
 用于存储文档嵌入向量并执行余弦相似度搜索
 """
 
-import math
-from typing import List, Dict, Tuple, TypedDict
+from typing import List, Optional
 
-
-class VectorStoreItem(TypedDict):
-    """向量存储项的类型定义"""
-    embedding: List[float]
-    document: str
+import numpy as np
 
 
 class VectorStore:
     """
     简单的内存向量存储
     支持添加嵌入向量和基于余弦相似度的检索
+    
+    采用列式存储：单位化后的嵌入向量保存在连续的 float32 矩阵中，
+    文档内容保存在平行的列表中
     """
     
-    def __init__(self):
-        """初始化空的向量存储"""
-        self.vector_store: List[VectorStoreItem] = []
+    # 矩阵的初始容量（行数），写满后按两倍扩容
+    INITIAL_CAPACITY = 64
+    
+    # int8 量化的缩放系数：单位向量分量映射到 [-127, 127]
+    INT8_SCALE = 127
+    
+    # 量化存储检索时每次反量化为 float32 的行数；NumPy 对 float16/int8
+    # 矩阵乘法没有 BLAS 实现，分块转换后再相乘以走 BLAS 路径，
+    # 块较小时转换结果可留在 CPU 缓存中
+    SEARCH_BLOCK_ROWS = 256
+    
+    # 量化模式 -> 存储类型
+    _STORAGE_DTYPES = {
+        None: np.float32,
+        "fp16": np.float16,
+        "int8": np.int8,
+    }
+    
+    def __init__(self, quantization: Optional[str] = None):
+        """
+        初始化空的向量存储
+        
+        Args:
+            quantization: 向量量化方式，None 表示 float32，
+                可选 "fp16"（内存减半）或 "int8"（内存降为 1/4）；
+                量化只节省内存：int8 检索速度与 float32 相当，fp16 受限于
+                NumPy 的半精度转换，检索明显慢于 float32
+                
+        Raises:
+            ValueError: 如果量化方式不受支持
+        """
+        if quantization not in self._STORAGE_DTYPES:
+            raise ValueError(f"不支持的量化方式: {quantization}")
+        
+        self.quantization = quantization
+        self._dtype = self._STORAGE_DTYPES[quantization]
+        self._embeddings: Optional[np.ndarray] = None  # (capacity, D)
+        self._documents: List[str] = []
+        self._n = 0  # 有效行数
     
     async def add_embedding(self, embedding: List[float], document: str) -> None:
         """
@@ -31,10 +65,36 @@ class VectorStore:
             embedding: 文档的嵌入向量
             document: 文档内容
         """
-        self.vector_store.append({
-            "embedding": embedding,
-            "document": document
-        })
+        await self.add_embeddings([embedding], [document])
+    
+    async def add_embeddings(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str]
+    ) -> None:
+        """
+        批量添加文档及其嵌入向量到存储
+        
+        Args:
+            embeddings: 文档的嵌入向量列表
+            documents: 文档内容列表（与 embeddings 一一对应）
+            
+        Raises:
+            ValueError: 如果嵌入向量与文档数量不一致
+        """
+        if len(embeddings) != len(documents):
+            raise ValueError(
+                f"嵌入向量数量 ({len(embeddings)}) 与文档数量 ({len(documents)}) 不一致"
+            )
+        count = len(documents)
+        if count == 0:
+            return
+        
+        rows = self._quantize(self._normalize(embeddings))
+        self._reserve(self._n + count, rows.shape[1])
+        self._embeddings[self._n:self._n + count] = rows
+        self._documents.extend(documents)
+        self._n += count
     
     async def search(
         self,
@@ -51,50 +111,99 @@ class VectorStore:
         Returns:
             最相似的 top_k 个文档列表
         """
-        # 计算所有文档的相似度分数
-        scored: List[Dict[str, float | str]] = [
-            {
-                "document": item["document"],
-                "score": self._cosine_similarity(query_embedding, item["embedding"])
-            }
-            for item in self.vector_store
-        ]
+        if self._n == 0 or top_k <= 0:
+            return []
         
-        # 按分数降序排序并取前 top_k 个
-        top_k_documents = [
-            item["document"]
-            for item in sorted(scored, key=lambda x: x["score"], reverse=True)[:top_k]
-        ]
+        # 文档向量已单位化，余弦相似度即一次矩阵-向量乘法
+        query = self._normalize(query_embedding)
+        if self.quantization is None:
+            scores = self._embeddings[:self._n] @ query
+        else:
+            scores = self._blockwise_scores(query)
         
-        return top_k_documents
+        # argpartition 选出前 top_k 个，再对这 k 个排序
+        k = min(top_k, self._n)
+        top_idx = np.argpartition(-scores, k - 1)[:k]
+        top_idx = top_idx[np.argsort(-scores[top_idx])]
+        
+        return [self._documents[i] for i in top_idx]
     
-    def _cosine_similarity(self, vec_a: List[float], vec_b: List[float]) -> float:
+    def _blockwise_scores(self, query: np.ndarray) -> np.ndarray:
         """
-        计算两个向量的余弦相似度
+        对量化存储逐块反量化为 float32 后计算相似度
         
         Args:
-            vec_a: 向量 A
-            vec_b: 向量 B
+            query: 单位化后的 float32 查询向量
             
         Returns:
-            余弦相似度值（范围 -1 到 1）
+            每个文档的相似度分数
+        """
+        if self.quantization == "int8":
+            # 将还原缩放并入查询向量，块内只需一次类型转换
+            query = query / self.INT8_SCALE
+        
+        scores = np.empty(self._n, dtype=np.float32)
+        for start in range(0, self._n, self.SEARCH_BLOCK_ROWS):
+            end = min(start + self.SEARCH_BLOCK_ROWS, self._n)
+            scores[start:end] = self._embeddings[start:end].astype(np.float32) @ query
+        return scores
+    
+    def _reserve(self, capacity: int, dim: int) -> None:
+        """
+        确保矩阵至少能容纳 capacity 行，不足时按两倍扩容
+        
+        Args:
+            capacity: 需要的行数
+            dim: 向量维度
             
         Raises:
-            ZeroDivisionError: 如果任一向量的范数为 0
+            ValueError: 如果向量维度与已存储的不一致
         """
-        # 计算点积
-        dot_product = sum(a * b for a, b in zip(vec_a, vec_b))
+        if self._embeddings is None:
+            size = max(self.INITIAL_CAPACITY, capacity)
+            self._embeddings = np.empty((size, dim), dtype=self._dtype)
+            return
+        
+        if self._embeddings.shape[1] != dim:
+            raise ValueError(
+                f"嵌入向量维度不一致: 期望 {self._embeddings.shape[1]}，实际 {dim}"
+            )
         
-        # 计算向量范数（模长）
-        norm_a = math.sqrt(sum(a * a for a in vec_a))
-        norm_b = math.sqrt(sum(b * b for b in vec_b))
+        if capacity > self._embeddings.shape[0]:
+            size = max(self._embeddings.shape[0] * 2, capacity)
+            grown = np.empty((size, dim), dtype=self._dtype)
+            grown[:self._n] = self._embeddings[:self._n]
+            self._embeddings = grown
+    
+    def _quantize(self, array: np.ndarray) -> np.ndarray:
+        """
+        将单位化后的 float32 向量转换为存储类型
         
-        # 避免除以零
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
+        Args:
+            array: 单位化后的向量或矩阵
+            
+        Returns:
+            存储类型的向量或矩阵
+        """
+        if self.quantization == "int8":
+            scaled = np.round(array * self.INT8_SCALE)
+            return np.clip(scaled, -self.INT8_SCALE, self.INT8_SCALE).astype(np.int8)
+        return array.astype(self._dtype, copy=False)
+    
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        """
+        将向量（或按行将矩阵）L2 单位化
         
-        # 返回余弦相似度
-        return dot_product / (norm_a * norm_b)
+        Args:
+            vectors: 单个向量或向量列表
+            
+        Returns:
+            float32 的单位向量（零向量保持为零）
+        """
+        array = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(array, axis=-1, keepdims=True)
+        return array / (norms + 1e-12)
     
     def get_all_documents(self) -> List[str]:
         """
@@ -103,7 +212,7 @@ class VectorStore:
         Returns:
             文档列表
         """
-        return [item["document"] for item in self.vector_store]
+        return list(self._documents)
     
     def size(self) -> int:
         """
@@ -112,11 +221,13 @@ class VectorStore:
         Returns:
             文档数量
         """
-        return len(self.vector_store)
+        return self._n
     
     def clear(self) -> None:
         """清空向量存储"""
-        self.vector_store = []
+        self._embeddings = None
+        self._documents = []
+        self._n = 0
 
 
 # # ============ 使用示例 ============
@@ -0,0 +1,35 @@
+"""
+进程内共享的 HTTP 客户端
+Embedding 请求与 LLM 请求复用同一个连接池，避免重复的 TCP/TLS 握手
+"""
+
+from typing import Optional
+
+import httpx
+
+
+_shared_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_client() -> httpx.AsyncClient:
+    """
+    获取共享的异步 HTTP 客户端（首次调用或关闭后重新创建）
+
+    Returns:
+        共享的 httpx.AsyncClient
+    """
+    global _shared_client
+    if _shared_client is None or _shared_client.is_closed:
+        _shared_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=3.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _shared_client
+
+
+async def close_shared_client() -> None:
+    """关闭共享的 HTTP 客户端，程序退出前调用"""
+    global _shared_client
+    if _shared_client is not None and not _shared_client.is_closed:
+        await _shared_client.aclose()
+    _shared_client = None
@@ -90,11 +90,6 @@ async def retrieve_context() -> str:
     """
     log_title('RAG - 检索上下文')
     
-    # 创建嵌入检索器
-    embedding_retriever = EmbeddingRetriever(
-        embedding_model="BAAI/bge-m3"
-    )
-    
     # 知识库目录
     knowledge_dir = Path.cwd() / 'knowledge'
     
@@ -105,8 +100,13 @@ async def retrieve_context() -> str:
         knowledge_dir.mkdir(exist_ok=True)
         return ""
     
-    # 读取所有知识文件
-    files = list(knowledge_dir.iterdir())
+    # 读取所有知识文件（scandir 复用目录项的类型信息，普通文件无需逐个 stat；
+    # 与 os.path.isfile 一致，指向文件的符号链接同样会被读取）
+    with os.scandir(knowledge_dir) as entries:
+        files = sorted(
+            (Path(entry.path) for entry in entries if entry.is_file()),
+            key=lambda path: path.name
+        )
     
     if not files:
         print("⚠️ 知识库目录为空")
@@ -114,20 +114,29 @@ async def retrieve_context() -> str:
     
     print(f"📚 找到 {len(files)} 个知识文件")
     
-    # 为每个文件生成嵌入向量
-    for file_path in files:
-        if file_path.is_file():
-            try:
-                # 读取文件内容
-                content = file_path.read_text(encoding='utf-8')
-                
-                print(f"  处理文件: {file_path.name} ({len(content)} 字符)")
-                
-                # 添加到向量存储
-                await embedding_retriever.embed_document(content)
-                
-            except Exception as e:
-                print(f"  ❌ 读取文件失败 {file_path.name}: {e}")
+    # 创建嵌入检索器
+    embedding_retriever = EmbeddingRetriever(
+        embedding_model="BAAI/bge-m3"
+    )
+    
+    # 在线程池中并发读取所有文件内容
+    contents = await asyncio.gather(
+        *[asyncio.to_thread(file_path.read_text, encoding='utf-8') for file_path in files],
+        return_exceptions=True
+    )
+    
+    documents = []
+    for file_path, content in zip(files, contents):
+        if isinstance(content, Exception):
+            print(f"  ❌ 读取文件失败 {file_path.name}: {content}")
+            continue
+        
+        print(f"  处理文件: {file_path.name} ({len(content)} 字符)")
+        documents.append(content)
+    
+    # 批量生成嵌入向量并添加到向量存储
+    if documents:
+        await embedding_retriever.embed_documents(documents)
     
     print(f"\n✅ 向量存储大小: {embedding_retriever.get_vector_store_size()}\n")
     
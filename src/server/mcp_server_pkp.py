@@ -27,6 +27,33 @@ def pkp_operation(a: float, b: float, c: float) -> float:
     return result
 
 
+# 工具定义在模块加载时构建一次，list_tools 直接返回
+TOOLS: list[Tool] = [
+    Tool(
+        name="pkp",
+        description="执行 PKP 运算：(a + b) * c，返回计算结果",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "a": {
+                    "type": "number",
+                    "description": "第一个数字"
+                },
+                "b": {
+                    "type": "number",
+                    "description": "第二个数字"
+                },
+                "c": {
+                    "type": "number",
+                    "description": "第三个数字（乘数）"
+                }
+            },
+            "required": ["a", "b", "c"]
+        }
+    )
+]
+
+
 # 创建 MCP Server 实例
 app = Server("pkp-server")
 
@@ -36,30 +63,7 @@ async def list_tools() -> list[Tool]:
     """
     列出服务器提供的所有工具
     """
-    return [
-        Tool(
-            name="pkp",
-            description="执行 PKP 运算：(a + b) * c，返回计算结果",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "a": {
-                        "type": "number",
-                        "description": "第一个数字"
-                    },
-                    "b": {
-                        "type": "number",
-                        "description": "第二个数字"
-                    },
-                    "c": {
-                        "type": "number",
-                        "description": "第三个数字（乘数）"
-                    }
-                },
-                "required": ["a", "b", "c"]
-            }
-        )
-    ]
+    return TOOLS
 
 
 @app.call_tool()
@@ -75,10 +79,9 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
         工具执行结果
     """
     if name == "pkp":
-        # 提取参数
-        a = arguments.get("a")
-        b = arguments.get("b")
-        c = arguments.get("c")
+        # 提取参数（只绑定一次 get 方法）
+        get = arguments.get
+        a, b, c = get("a"), get("b"), get("c")
         
         # 参数验证
         if a is None or b is None or c is None:
@@ -3,20 +3,31 @@
 """
 
 import asyncio
+from pathlib import Path
+
 from MCPClient import MCPClient
 from utils import log_title
 
 
+# 服务器脚本路径在模块加载时解析一次，不依赖当前工作目录
+_SERVER_PATH = (Path(__file__).parent / 'mcp_server_pkp.py').resolve()
+_SERVER_EXISTS = _SERVER_PATH.is_file()
+
+
 async def test_pkp_server():
     """测试 PKP Server 的功能"""
     
     log_title("测试 PKP MCP Server")
     
+    if not _SERVER_EXISTS:
+        print(f"❌ 未找到服务器脚本: {_SERVER_PATH}")
+        return
+    
     # 创建 MCP 客户端连接到 PKP Server
     pkp_client = MCPClient(
         name='pkp-client',
         command='python',
-        args=['mcp_server_pkp.py']
+        args=[str(_SERVER_PATH)]
     )
     
     try:
@@ -25,7 +36,8 @@ async def test_pkp_server():
         
         # 获取工具列表
         tools = pkp_client.get_tools()
-        print(f"\n📦 可用工具: {[t['name'] for t in tools]}")
+        names = ", ".join(t['name'] for t in tools)
+        print(f"\n📦 可用工具: [{names}]")
         
         # 打印工具详情
         for tool in tools:
@@ -43,11 +55,14 @@ async def test_pkp_server():
             {"a": 7.5, "b": 2.5, "c": 4},  # (7.5 + 2.5) * 4 = 40
         ]
         
-        for i, params in enumerate(test_cases, 1):
+        # 各测试用例互不依赖，并发发送
+        results = await asyncio.gather(
+            *[pkp_client.call_tool("pkp", params) for params in test_cases]
+        )
+        
+        for i, (params, result) in enumerate(zip(test_cases, results), 1):
             print(f"\n测试 {i}:")
             print(f"  参数: a={params['a']}, b={params['b']}, c={params['c']}")
-            
-            result = await pkp_client.call_tool("pkp", params)
             print(f"  结果: {result}")
         
         # 测试错误处理
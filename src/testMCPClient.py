@@ -1,4 +1,5 @@
 import asyncio
+import os
 from utils import log_title
 from MCPClient import MCPClient  # 注意：文件名通常用下划线
 
@@ -27,10 +28,11 @@ async def main():
         for tool in tools:
             print(f"  - {tool['name']}: {tool['description']}")
         
-        # 也可以打印完整的工具定义
-        print("\n📋 完整工具定义:")
-        import json
-        print(json.dumps(tools, indent=2, ensure_ascii=False))
+        # 设置 MCP_DEBUG 环境变量时打印完整的工具定义
+        if os.environ.get("MCP_DEBUG"):
+            print("\n📋 完整工具定义:")
+            import json
+            print(json.dumps(tools, indent=2, ensure_ascii=False))
         
     finally:
         # 确保关闭连接
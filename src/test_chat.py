@@ -4,19 +4,45 @@
 """
 
 import asyncio
-import json
+import io
 import os
-from typing import List, Dict, Any
+import sys
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+import orjson
 from dotenv import load_dotenv
 
 # 导入我们实现的模块
 from utils import log_title
 from ChatOpenAI import ChatOpenAI, Tool, ToolCall
+from http_client import close_shared_client
 
 # 加载环境变量
 load_dotenv()
 
 
+# 当前任务的输出缓冲；并发运行的测试各自写入自己的缓冲，结束后整体打印
+_output_buffer: ContextVar[Optional[io.StringIO]] = ContextVar("_output_buffer", default=None)
+
+
+class _TaskLocalStdout:
+    """按任务分流的 stdout：当前任务设置了缓冲时写入缓冲，否则写入原始输出"""
+    
+    def __init__(self, stream):
+        self._stream = stream
+    
+    def write(self, text: str) -> int:
+        buffer = _output_buffer.get()
+        return (buffer if buffer is not None else self._stream).write(text)
+    
+    def flush(self) -> None:
+        if _output_buffer.get() is None:
+            self._stream.flush()
+    
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
 class TestChatOpenAI:
     """测试类"""
     
@@ -130,7 +156,7 @@ class TestChatOpenAI:
                 print(f"   - 参数: {tool_args_str}")
                 
                 # 解析参数
-                tool_args = json.loads(tool_args_str)
+                tool_args = orjson.loads(tool_args_str)
                 
                 # 模拟工具执行
                 tool_result = self.mock_tool_execution(tool_name, tool_args)
@@ -154,23 +180,23 @@ class TestChatOpenAI:
         if tool_name == "search_database":
             query = args.get("query", "")
             limit = args.get("limit", 5)
-            return json.dumps({
+            return orjson.dumps({
                 "results": [
                     {"title": f"向量数据库技术综述 {i+1}", "score": 0.95 - i*0.1}
                     for i in range(min(limit, 3))
                 ],
                 "total": limit
-            }, ensure_ascii=False)
+            }).decode()
         
         elif tool_name == "get_current_time":
             from datetime import datetime
             timezone = args.get("timezone", "UTC")
-            return json.dumps({
+            return orjson.dumps({
                 "time": datetime.now().isoformat(),
                 "timezone": timezone
-            })
+            }).decode()
         
-        return json.dumps({"error": "未知工具"})
+        return orjson.dumps({"error": "未知工具"}).decode()
     
     async def test_system_prompt_and_context(self):
         """测试 4：系统提示词和初始上下文"""
@@ -179,7 +205,7 @@ class TestChatOpenAI:
         chat = ChatOpenAI(
             model="google/gemini-2.0-flash-exp:free",
             system_prompt="你是一个海盗船长，说话要有海盗风格。",
-            context="我们正在寻找传说中的宝藏。"
+            context="我们正在寻找传说中的宝藏。",
         )
         
         response = await chat.chat("你好！")
@@ -187,15 +213,45 @@ class TestChatOpenAI:
         print(f"\n\n✅ 响应内容: {response['content']}")
         print("✅ 测试 4 通过！\n")
     
+    async def _run_buffered(self, test: Callable[[], Awaitable[None]]) -> None:
+        """
+        运行单个测试并缓冲其输出，测试结束（包括失败）后一次性打印
+        
+        Args:
+            test: 测试方法
+        """
+        buffer = io.StringIO()
+        _output_buffer.set(buffer)
+        try:
+            await test()
+        finally:
+            _output_buffer.set(None)
+            sys.stdout.write(buffer.getvalue())
+            sys.stdout.flush()
+    
     async def run_all_tests(self):
         """运行所有测试"""
         log_title("开始测试 ChatOpenAI 类")
         
         try:
-            await self.test_basic_chat()
-            await self.test_multi_turn_chat()
+            # 测试 1、2、4 互不依赖，并发执行以重叠网络往返；
+            # 各测试的输出分别缓冲，结束后整体打印，避免交错
+            stdout = sys.stdout
+            sys.stdout = _TaskLocalStdout(stdout)
+            try:
+                # 等待所有测试结束再报告失败，确保每个测试的输出完整打印
+                results = await asyncio.gather(
+                    self._run_buffered(self.test_basic_chat),
+                    self._run_buffered(self.test_multi_turn_chat),
+                    self._run_buffered(self.test_system_prompt_and_context),
+                    return_exceptions=True
+                )
+            finally:
+                sys.stdout = stdout
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
             await self.test_tool_calling()
-            await self.test_system_prompt_and_context()
             
             log_title("所有测试通过 ✅")
             
@@ -209,7 +265,10 @@ class TestChatOpenAI:
 async def main():
     """主函数"""
     tester = TestChatOpenAI()
-    await tester.run_all_tests()
+    try:
+        await tester.run_all_tests()
+    finally:
+        await close_shared_client()
 
 
 if __name__ == "__main__":
@@ -2,6 +2,10 @@ from rich.console import Console
 
 console = Console()
 
+# 标题总宽度及预先生成的填充条
+TITLE_WIDTH = 80
+_BAR = '=' * TITLE_WIDTH
+
 def log_title(message: str) -> None:
     """
     打印一个居中的标题，两边用等号填充
@@ -9,14 +13,19 @@ def log_title(message: str) -> None:
     Args:
         message: 要显示的标题文本
     """
-    total_length = 80
     message_length = len(message)
-    padding = max(0, total_length - message_length - 4)  # 4 for spaces and "="
+    padding = max(0, TITLE_WIDTH - message_length - 4)  # 4 for spaces and "="
     
-    left_padding = '=' * (padding // 2)
-    right_padding = '=' * ((padding + 1) // 2)  # 向上取整
+    left_padding = _BAR[:padding // 2]
+    right_padding = _BAR[:(padding + 1) // 2]  # 向上取整
     
     padded_message = f"{left_padding} {message} {right_padding}"
     
-    # 使用 rich 的样式标记
-    console.print(f"[bold cyan]{padded_message}[/bold cyan]")
+    # 直接指定样式，跳过 rich 的标记解析和高亮
+    console.print(
+        padded_message,
+        style="bold cyan",
+        markup=False,
+        highlight=False,
+        soft_wrap=True
+    )